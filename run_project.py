@@ -113,7 +113,7 @@ def view_reports():
     print("\n📊 DATA FILES:")
     if os.path.exists(data_dir):
         for file in sorted(os.listdir(data_dir)):
-            if file.endswith('.csv'):
+            if file.endswith(('.csv', '.parquet')):
                 path = os.path.join(data_dir, file)
                 size = os.path.getsize(path) / 1024  # KB
                 print(f"  • {file} ({size:.1f} KB)")
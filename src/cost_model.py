@@ -5,11 +5,106 @@ Calculate network costs in Nepalese Rupees (NRS)
 """
 
 import pandas as pd
-import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import orjson
+import hashlib
+import heapq
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import sys
 import os
 
+from utils import (
+    flow_file, ips_to_u32, prefixes_to_masks, prefix_octet_table, match_prefixes_by_octet,
+    OCTET_MATCH, OCTET_CHECK,
+)
+
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# CSV bytes per streamed chunk (~200k flows at ~200 bytes per row)
+CHUNK_BYTES = 40 << 20
+
+# Rows per streamed chunk when the input is Parquet
+CHUNK_ROWS = 200000
+
+# Traffic types produced by classify_traffic, indexed by the kernel's codes
+TRAFFIC_CODES = np.array(['INTERNAL', 'CLOUD_EGRESS', 'INTERNET_EGRESS', 'INTERNET_INGRESS', 'OTHER'])
+
+if HAS_NUMBA:
+    @njit(inline='always', cache=True)
+    def _match_octet(ip, table, values, masks, lo, hi):
+        """First-octet lookup, falling back to the prefix masks in [lo, hi)"""
+        octet_class = table[ip >> 24]
+        if octet_class == OCTET_MATCH:
+            return True
+        if octet_class == OCTET_CHECK:
+            for j in range(lo, hi):
+                if (ip & masks[j]) == values[j]:
+                    return True
+        return False
+    
+    @njit(parallel=True, cache=True)
+    def _classify_cost(src, dst, nbytes, is_peak, rates, internal_table, cloud_table,
+                       values, masks, n_internal, surcharge):
+        """Fused classify + cost kernel over uint32 IPs (see TRAFFIC_CODES)"""
+        n = src.shape[0]
+        n_prefixes = values.shape[0]
+        codes = np.empty(n, dtype=np.int8)
+        costs = np.empty(n, dtype=np.float64)
+        
+        for i in prange(n):
+            src_int = _match_octet(src[i], internal_table, values, masks, 0, n_internal)
+            dst_int = _match_octet(dst[i], internal_table, values, masks, 0, n_internal)
+            dst_cloud = _match_octet(dst[i], cloud_table, values, masks, n_internal, n_prefixes)
+            
+            if src_int and dst_int:
+                code = 0
+            elif src_int and dst_cloud:
+                code = 1
+            elif src_int:
+                code = 2
+            elif dst_int:
+                code = 3
+            else:
+                code = 4
+            
+            cost = rates[code] * (nbytes[i] * (1.0 / 1024**3))
+            if is_peak[i]:
+                cost *= surcharge
+            
+            codes[i] = code
+            costs[i] = cost
+        
+        return codes, costs
+
+def top_k_positions(values, k, tiebreak=None):
+    """
+    Positions of the k largest values in descending order, via an O(n) partition
+    Ties go to the smaller tiebreak key (default: earlier position), NaNs come last
+    """
+    values = np.asarray(values, dtype=np.float64)
+    nan = np.isnan(values)
+    candidates = np.flatnonzero(~nan)
+    if len(candidates) > k:
+        kth = len(candidates) - k
+        threshold = np.partition(values[candidates], kth)[kth]
+        candidates = candidates[values[candidates] >= threshold]
+    
+    keys = candidates if tiebreak is None else np.asarray(tiebreak)[candidates]
+    top = candidates[np.lexsort((keys, -values[candidates]))][:k]
+    if len(top) < k and nan.any():
+        top = np.concatenate([top, np.flatnonzero(nan)[:k - len(top)]])
+    return top
+
 class CostCalculatorNRS:
     def __init__(self):
         # All prices in Nepalese Rupees (NRS) per GB
@@ -43,31 +138,62 @@ class CostCalculatorNRS:
             '172.20.', '172.21.', '172.22.', '172.23.', '172.24.', '172.25.',
             '172.26.', '172.27.', '172.28.', '172.29.', '172.30.', '172.31.',
         ]
+        
+        # Prefix tuples for single-call str.startswith, most frequent hits first
+        self._internal_tuple = tuple(sorted(self.internal_prefixes, key=self._prefix_rank))
+        self._cloud_tuple = tuple(sorted(self.cloud_prefixes, key=self._prefix_rank))
+        
+        # (value, mask) pairs for matching whole uint32 IP columns at once
+        self._internal_values, self._internal_masks = prefixes_to_masks(self.internal_prefixes)
+        self._cloud_values, self._cloud_masks = prefixes_to_masks(self.cloud_prefixes)
+        
+        # First-octet dispatch tables; the masks above only settle 172.x / 192.x / 8.x
+        self._internal_table = prefix_octet_table(self.internal_prefixes)
+        self._cloud_table = prefix_octet_table(self.cloud_prefixes)
+    
+    @staticmethod
+    def _prefix_rank(prefix):
+        """Sort key placing the prefixes that dominate typical captures first"""
+        common = ('192.168.', '10.', '20.')
+        return common.index(prefix) if prefix in common else len(common)
     
     def classify_traffic(self, src_ip, dst_ip):
         """Classify traffic type for cost calculation"""
         
+        src_is_internal = src_ip.startswith(self._internal_tuple)
+        dst_is_internal = dst_ip.startswith(self._internal_tuple)
+        
         # Check if internal traffic
-        if any(src_ip.startswith(p) for p in self.internal_prefixes) and \
-           any(dst_ip.startswith(p) for p in self.internal_prefixes):
+        if src_is_internal and dst_is_internal:
             return 'INTERNAL'
         
-        # Determine direction
-        src_is_internal = any(src_ip.startswith(p) for p in self.internal_prefixes)
-        
         # Check for cloud destinations
-        is_cloud_dest = any(dst_ip.startswith(p) for p in self.cloud_prefixes)
+        is_cloud_dest = dst_ip.startswith(self._cloud_tuple)
         
         # Classify based on direction and destination
         if src_is_internal and is_cloud_dest:
             return 'CLOUD_EGRESS'
         elif src_is_internal:
             return 'INTERNET_EGRESS'
-        elif not src_is_internal and any(dst_ip.startswith(p) for p in self.internal_prefixes):
+        elif dst_is_internal:
             return 'INTERNET_INGRESS'
         else:
             return 'OTHER'
     
+    def classify_flow_codes(self, src_u32, dst_u32):
+        """Vectorized classify_traffic over uint32-packed src/dst IPs, as int8 indices into TRAFFIC_CODES"""
+        
+        src_int = match_prefixes_by_octet(src_u32, self._internal_table, self._internal_values, self._internal_masks)
+        dst_int = match_prefixes_by_octet(dst_u32, self._internal_table, self._internal_values, self._internal_masks)
+        dst_cloud = match_prefixes_by_octet(dst_u32, self._cloud_table, self._cloud_values, self._cloud_masks)
+        
+        # Same precedence as classify_traffic: first matching condition wins
+        return np.select(
+            [src_int & dst_int, src_int & dst_cloud, src_int, dst_int],
+            [0, 1, 2, 3],
+            default=4
+        ).astype(np.int8)
+    
     def calculate_flow_cost_nrs(self, flow):
         """Calculate cost in Nepalese Rupees for a flow"""
         
@@ -94,65 +220,157 @@ class CostCalculatorNRS:
         
         print("[+] Classifying traffic and calculating costs...")
         
-        # Add traffic classification
-        df['traffic_type'] = df.apply(
-            lambda row: self.classify_traffic(row['src_ip'], row['dst_ip']), 
-            axis=1
-        )
+        # Pack IPs to uint32 once (kept on the frame for reuse downstream)
+        if 'src_ip_u32' not in df.columns:
+            df['src_ip_u32'] = ips_to_u32(df['src_ip'])
+        if 'dst_ip_u32' not in df.columns:
+            df['dst_ip_u32'] = ips_to_u32(df['dst_ip'])
         
         # Add peak hour flag (if hour column exists)
         if 'hour' in df.columns:
-            df['is_peak'] = df['hour'].apply(lambda x: x in self.peak_hours)
+            # Vectorized range check (peak_hours is a contiguous range)
+            peak = df['hour'].between(self.peak_hours.start, self.peak_hours.stop - 1)
+            is_peak = peak.fillna(False).to_numpy(dtype=bool)
         else:
-            df['is_peak'] = False
-        
-        # Calculate cost for each flow
-        df['cost_nrs'] = df.apply(self.calculate_flow_cost_nrs, axis=1)
+            is_peak = np.zeros(len(df), dtype=bool)
+        
+        src_u32 = df['src_ip_u32'].to_numpy(dtype=np.uint32)
+        dst_u32 = df['dst_ip_u32'].to_numpy(dtype=np.uint32)
+        total_bytes = df['total_bytes'].to_numpy(dtype=np.float64)
+        total_gb = total_bytes * (1.0 / 1024**3)
+        
+        # Per-GB rate for each traffic code
+        rates = np.array([self.pricing.get(t, 10) for t in TRAFFIC_CODES], dtype=np.float64)
+        
+        if HAS_NUMBA:
+            # Classify and price every flow in one parallel pass
+            codes, costs = _classify_cost(
+                src_u32, dst_u32, total_bytes, is_peak, rates,
+                self._internal_table, self._cloud_table,
+                np.concatenate([self._internal_values, self._cloud_values]),
+                np.concatenate([self._internal_masks, self._cloud_masks]),
+                len(self._internal_values), self.peak_surcharge
+            )
+            df['traffic_type'] = TRAFFIC_CODES[codes]
+            df['is_peak'] = is_peak
+            df['cost_nrs'] = np.round(costs, 4)
+        else:
+            # Add traffic classification
+            codes = self.classify_flow_codes(src_u32, dst_u32)
+            df['traffic_type'] = TRAFFIC_CODES[codes]
+            df['is_peak'] = is_peak
+            
+            # Calculate cost for each flow (column-wise calculate_flow_cost_nrs)
+            surcharge = np.where(is_peak, self.peak_surcharge, 1.0)
+            df['cost_nrs'] = np.round(rates[codes] * total_gb * surcharge, 4)
         
         # Convert bytes to GB for reporting
-        df['total_gb'] = df['total_bytes'] / (1024**3)
+        df['total_gb'] = total_gb
         
         return df
     
-    def generate_cost_report(self, df):
-        """Generate comprehensive cost analysis report"""
+    def new_report_totals(self):
+        """Empty running aggregates for accumulate_report_totals"""
+        
+        n_types = len(self.pricing)
+        return {
+            'flows': 0,
+            'total_gb': 0.0,
+            'total_cost_nrs': 0.0,
+            'gb_by_type': np.zeros(n_types),
+            'cost_by_type': np.zeros(n_types),
+            'flows_by_type': np.zeros(n_types, dtype=np.int64),
+            'has_peak': False,
+            'peak_cost': 0.0,
+            'off_peak_cost': 0.0,
+            'large_flows': 0,
+            'large_flow_cost': 0.0,
+            'top_expensive': [],
+            'sources': None,
+        }
+    
+    def accumulate_report_totals(self, totals, df):
+        """Fold a (chunk of a) costed flows dataframe into the running report totals"""
         
         # Ensure numeric columns
         df['total_bytes'] = pd.to_numeric(df['total_bytes'], errors='coerce').fillna(0)
         
-        # Calculate total cost
-        total_cost_nrs = df['cost_nrs'].sum()
-        total_data_gb = df['total_gb'].sum()
+        costs = df['cost_nrs'].to_numpy(dtype=np.float64)
+        total_gb = df['total_gb'].to_numpy(dtype=np.float64)
         
-        # Monthly projection (assuming this is one hour of data)
-        monthly_projection_nrs = total_cost_nrs * 24 * 30
+        totals['flows'] += len(df)
+        totals['total_gb'] += total_gb.sum()
+        totals['total_cost_nrs'] += costs.sum()
         
-        # Cost breakdown by traffic type
-        cost_breakdown = df.groupby('traffic_type').agg({
-            'total_gb': 'sum',
-            'cost_nrs': 'sum',
-            'src_ip': 'count'
-        }).round(4).to_dict('index')
+        # Cost breakdown by traffic type (one bincount pass per column)
+        traffic_types = sorted(self.pricing)
+        codes = pd.Categorical(df['traffic_type'], categories=traffic_types).codes
+        known = codes >= 0
+        codes = codes[known]
+        totals['gb_by_type'] += np.bincount(codes, weights=total_gb[known], minlength=len(traffic_types))
+        totals['cost_by_type'] += np.bincount(codes, weights=costs[known], minlength=len(traffic_types))
+        totals['flows_by_type'] += np.bincount(codes, minlength=len(traffic_types))
         
-        # Top 10 most expensive flows
-        top_expensive = df.nlargest(10, 'cost_nrs')[[
+        # Peak hour cost
+        if 'is_peak' in df.columns:
+            totals['has_peak'] = True
+            peak_mask = df['is_peak'].to_numpy(dtype=bool)
+            totals['peak_cost'] += costs[peak_mask].sum()
+            totals['off_peak_cost'] += costs[~peak_mask].sum()
+        
+        # Flows larger than 0.5 GB
+        large = total_gb > 0.5
+        totals['large_flows'] += int(large.sum())
+        totals['large_flow_cost'] += costs[large].sum()
+        
+        # Top 10 most expensive flows so far (earlier flows win ties, like nlargest)
+        chunk_top = df.iloc[top_k_positions(costs, 10)][[
             'src_ip', 'dst_ip', 'traffic_type', 'total_gb', 'cost_nrs'
         ]].to_dict('records')
+        totals['top_expensive'] = heapq.nlargest(
+            10, totals['top_expensive'] + chunk_top, key=lambda flow: flow['cost_nrs']
+        )
         
         # Cost by source IP
-        top_sources = df.groupby('src_ip').agg({
+        sources = df.groupby('src_ip').agg({
             'cost_nrs': 'sum',
             'total_gb': 'sum'
-        }).nlargest(5, 'cost_nrs').to_dict('index')
+        })
+        if totals['sources'] is not None:
+            sources = pd.concat([totals['sources'], sources]).groupby(level=0, sort=False).sum()
+        totals['sources'] = sources
+        
+        return totals
+    
+    def build_cost_report(self, totals):
+        """Compile the cost analysis report from accumulated totals"""
+        
+        total_cost_nrs = totals['total_cost_nrs']
+        total_data_gb = totals['total_gb']
+        
+        # Monthly projection (assuming this is one hour of data)
+        monthly_projection_nrs = total_cost_nrs * 24 * 30
+        
+        cost_breakdown = {
+            traffic_type: {
+                'total_gb': round(float(totals['gb_by_type'][i]), 4),
+                'cost_nrs': round(float(totals['cost_by_type'][i]), 4),
+                'src_ip': int(totals['flows_by_type'][i])
+            }
+            for i, traffic_type in enumerate(sorted(self.pricing)) if totals['flows_by_type'][i] > 0
+        }
+        
+        if totals['sources'] is not None:
+            sources = totals['sources']
+            top = top_k_positions(sources['cost_nrs'], 5, tiebreak=sources.index.to_numpy())
+            top_sources = sources.iloc[top].to_dict('index')
+        else:
+            top_sources = {}
         
         # Peak vs off-peak analysis
-        if 'is_peak' in df.columns:
-            peak_df = df[df['is_peak'] == True]
-            off_peak_df = df[df['is_peak'] == False]
-            
-            peak_cost = peak_df['cost_nrs'].sum()
-            off_peak_cost = off_peak_df['cost_nrs'].sum()
-            
+        if totals['has_peak']:
+            peak_cost = totals['peak_cost']
+            off_peak_cost = totals['off_peak_cost']
             peak_percentage = (peak_cost / total_cost_nrs * 100) if total_cost_nrs > 0 else 0
         else:
             peak_cost = 0
@@ -160,7 +378,7 @@ class CostCalculatorNRS:
             peak_percentage = 0
         
         # Generate recommendations
-        recommendations = self._generate_recommendations(df, total_cost_nrs)
+        recommendations = self._generate_recommendations(totals)
         
         # Compile report
         report = {
@@ -172,7 +390,7 @@ class CostCalculatorNRS:
                 'peak_surcharge': '50%'
             },
             'summary': {
-                'total_flows': int(len(df)),
+                'total_flows': int(totals['flows']),
                 'total_data_gb': round(total_data_gb, 4),
                 'total_cost_nrs': round(total_cost_nrs, 2),
                 'average_cost_per_gb': round(total_cost_nrs / max(total_data_gb, 1), 2),
@@ -182,23 +400,30 @@ class CostCalculatorNRS:
                 'off_peak_cost_nrs': round(off_peak_cost, 2)
             },
             'breakdown': cost_breakdown,
-            'top_expensive_flows': top_expensive,
+            'top_expensive_flows': totals['top_expensive'],
             'top_costly_sources': top_sources,
             'recommendations': recommendations,
-            'estimated_savings': self._estimate_savings(df, total_cost_nrs)
+            'estimated_savings': self._estimate_savings(total_cost_nrs, recommendations)
         }
         
         return report
     
-    def _generate_recommendations(self, df, total_cost_nrs):
+    def generate_cost_report(self, df):
+        """Generate comprehensive cost analysis report"""
+        
+        totals = self.accumulate_report_totals(self.new_report_totals(), df)
+        return self.build_cost_report(totals)
+    
+    def _generate_recommendations(self, totals):
         """Generate cost optimization recommendations"""
         
         recommendations = []
+        total_cost_nrs = totals['total_cost_nrs']
         
         # Check for expensive cloud egress
-        cloud_egress = df[df['traffic_type'] == 'CLOUD_EGRESS']
-        if not cloud_egress.empty:
-            cloud_cost = cloud_egress['cost_nrs'].sum()
+        cloud_index = sorted(self.pricing).index('CLOUD_EGRESS')
+        if totals['flows_by_type'][cloud_index] > 0:
+            cloud_cost = totals['cost_by_type'][cloud_index]
             cloud_percentage = (cloud_cost / total_cost_nrs * 100) if total_cost_nrs > 0 else 0
             
             if cloud_cost > 100:  # More than 100 NRS
@@ -212,9 +437,8 @@ class CostCalculatorNRS:
                 })
         
         # Check for peak hour expensive traffic
-        if 'is_peak' in df.columns:
-            peak_traffic = df[df['is_peak'] == True]
-            peak_cost = peak_traffic['cost_nrs'].sum()
+        if totals['has_peak']:
+            peak_cost = totals['peak_cost']
             
             if peak_cost > total_cost_nrs * 0.6:  # More than 60% during peak
                 recommendations.append({
@@ -226,14 +450,13 @@ class CostCalculatorNRS:
                     'priority': 'MEDIUM'
                 })
         
-        # Check for large flows
-        large_flows = df[df['total_gb'] > 0.5]  # Flows larger than 0.5 GB
-        if len(large_flows) > 3:
-            large_flow_cost = large_flows['cost_nrs'].sum()
+        # Check for large flows (>0.5 GB)
+        if totals['large_flows'] > 3:
+            large_flow_cost = totals['large_flow_cost']
             recommendations.append({
                 'id': 'LARGE_FLOW_OPT',
                 'title': 'Large Flow Optimization',
-                'description': f'{len(large_flows)} large flows detected (>0.5 GB each)',
+                'description': f"{totals['large_flows']} large flows detected (>0.5 GB each)",
                 'suggestion': 'Implement traffic shaping or compression for large transfers',
                 'potential_savings_nrs': round(large_flow_cost * 0.2, 2),  # 20% savings
                 'priority': 'MEDIUM'
@@ -261,11 +484,11 @@ class CostCalculatorNRS:
         
         return recommendations
     
-    def _estimate_savings(self, df, total_cost_nrs):
+    def _estimate_savings(self, total_cost_nrs, recommendations):
         """Estimate potential savings"""
         
         # Calculate total potential savings from recommendations
-        total_potential_savings = sum(rec['potential_savings_nrs'] for rec in self._generate_recommendations(df, total_cost_nrs))
+        total_potential_savings = sum(rec['potential_savings_nrs'] for rec in recommendations)
         
         # Monthly savings projection
         monthly_savings = total_potential_savings * 24 * 30
@@ -276,52 +499,127 @@ class CostCalculatorNRS:
             'savings_percentage': round((total_potential_savings / max(total_cost_nrs, 1)) * 100, 1)
         }
 
-def main():
-    """Main function to run the cost analysis"""
+def arrow_dtype(arrow_type):
+    """types_mapper keeping Arrow-backed columns, except dictionaries (plain Categorical)"""
+    return None if pa.types.is_dictionary(arrow_type) else pd.ArrowDtype(arrow_type)
+
+def read_flow_chunks(input_file, block_size=CHUNK_BYTES):
+    """Stream a flows Parquet or CSV file as Arrow-backed DataFrame chunks"""
     
-    print("="*60)
-    print("FlowSpend: NRS Cost Analysis")
-    print("="*60)
+    if input_file.endswith('.parquet'):
+        parquet = pq.ParquetFile(input_file)
+        schema = parquet.schema_arrow
+        reader = parquet.iter_batches(batch_size=CHUNK_ROWS)
+    else:
+        reader = pa_csv.open_csv(
+            input_file,
+            read_options=pa_csv.ReadOptions(block_size=block_size),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={'total_bytes': pa.int64(), 'hour': pa.int16()}
+            )
+        )
+        schema = reader.schema
     
-    # Get input file from command line or use default
-    input_file = sys.argv[1] if len(sys.argv) > 1 else "data/enriched_flows.csv"
+    n_chunks = 0
+    for batch in reader:
+        n_chunks += 1
+        yield batch.to_pandas(types_mapper=arrow_dtype)
     
-    # Check if file exists
-    if not os.path.exists(input_file):
-        print(f"[!] Error: {input_file} not found!")
-        print("[!] Please run the pipeline first:")
-        print("    1. python pcap_to_flows.py")
-        print("    2. python real_scale.py")
-        print("    3. python flow_enricher.py")
-        return None
+    # An input without rows still yields one empty chunk, so every output gets rewritten
+    if n_chunks == 0:
+        yield schema.empty_table().to_pandas(types_mapper=arrow_dtype)
+
+class FlowChunkWriter:
+    """Write costed flow chunks in order to Parquet, optionally mirrored to CSV"""
     
-    # Load enriched flows
-    print(f"[+] Loading data: {input_file}")
-    df = pd.read_csv(input_file)
-    print(f"[+] Loaded {len(df)} flows")
+    def __init__(self, parquet_file, csv_file=None):
+        self.parquet_file = parquet_file
+        self.csv_file = csv_file
+        self._parquet_writer = None
+        self._csv_writer = None
     
-    # Initialize cost calculator
-    calculator = CostCalculatorNRS()
+    def write(self, chunk):
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self.parquet_file, table.schema, compression='zstd')
+        self._parquet_writer.write_table(table)
+        
+        if self.csv_file:
+            # Reuse the Arrow table: one C++ CSV writer for the whole run
+            if self._csv_writer is None:
+                self._csv_writer = pa_csv.CSVWriter(self.csv_file, table.schema)
+            self._csv_writer.write_table(table)
     
-    # Enrich flows with costs
-    df_with_costs = calculator.enrich_flows_with_costs(df)
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if self._csv_writer is not None:
+            self._csv_writer.close()
+            self._csv_writer = None
+
+def produce_flow_chunks(input_file, chunks, stop):
+    """Reader stage: put CSV chunks on the queue, followed by a None sentinel"""
     
-    # Generate cost report
-    report = calculator.generate_cost_report(df_with_costs)
+    try:
+        for chunk in read_flow_chunks(input_file):
+            if stop.is_set():
+                return
+            chunks.put(chunk)
+    finally:
+        chunks.put(None)
+
+def stream_flow_costs(pool, input_file, calculator, writer):
+    """
+    Cost a flows CSV chunk by chunk and return the accumulated report totals
+    A reader thread parses chunks ahead while the calling thread costs the
+    current one and a writer thread saves the previous one
+    """
+    totals = calculator.new_report_totals()
+    chunks = queue.Queue(maxsize=2)
+    stop = threading.Event()
     
-    # Save enriched data
-    output_file = "data/final_analysis.csv"
-    df_with_costs.to_csv(output_file, index=False)
-    print(f"[✓] Saved enriched flows to: {output_file}")
+    reader = pool.submit(produce_flow_chunks, input_file, chunks, stop)
+    pending_write = None
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            
+            # Enrich flows with costs and fold them into the report totals
+            chunk = calculator.enrich_flows_with_costs(chunk)
+            calculator.accumulate_report_totals(totals, chunk)
+            
+            # Save enriched data (one write in flight keeps chunks ordered)
+            if pending_write is not None:
+                pending_write.result()
+            pending_write = pool.submit(writer.write, chunk)
+    finally:
+        # Unblock the reader if we stopped early with a full queue
+        stop.set()
+        while not reader.done():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
     
-    # Save report to JSON
-    os.makedirs("reports", exist_ok=True)
-    with open('reports/cost_analysis_report.json', 'w') as f:
-        json.dump(report, f, indent=2)
-    print(f"[✓] Saved detailed report to: reports/cost_analysis_report.json")
+    reader.result()
+    if pending_write is not None:
+        pending_write.result()
+    
+    return totals
+
+def write_json_report(report, report_file):
+    """Save the cost report as JSON"""
     
-    # Create simple text summary
-    with open('reports/executive_summary.txt', 'w') as f:
+    with open(report_file, 'wb') as f:
+        f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+
+def write_executive_summary(report, summary_file):
+    """Save a short plain-text summary of the cost report"""
+    
+    with open(summary_file, 'w') as f:
         f.write("="*60 + "\n")
         f.write("EXECUTIVE SUMMARY: NETWORK COST ANALYSIS\n")
         f.write("="*60 + "\n\n")
@@ -338,10 +636,18 @@ def main():
             f.write(f"• [{rec['priority']}] {rec['title']}\n")
             f.write(f"  {rec['suggestion']}\n")
             f.write(f"  Savings: NRS {rec['potential_savings_nrs']:,.2f}\n\n")
+
+def input_fingerprint(input_file):
+    """Cheap fingerprint of an input file: BLAKE2 of its first MiB plus size and mtime"""
     
-    print(f"[✓] Saved executive summary to: reports/executive_summary.txt")
+    with open(input_file, 'rb') as f:
+        digest = hashlib.blake2b(f.read(1 << 20)).hexdigest()
+    stat = os.stat(input_file)
+    return f"{os.path.abspath(input_file)}:{digest}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def print_summary(report):
+    """Print the results summary of a cost report"""
     
-    # Print summary
     print("\n" + "="*60)
     print("RESULTS SUMMARY")
     print("="*60)
@@ -378,8 +684,96 @@ def main():
     print("\n" + "="*60)
     print("ANALYSIS COMPLETE!")
     print("="*60)
+
+def main():
+    """Main function to run the cost analysis"""
+    
+    print("="*60)
+    print("FlowSpend: NRS Cost Analysis")
+    print("="*60)
+    
+    # Get input file from command line or use default (--csv also writes a CSV copy)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    input_file = args[0] if args else "data/enriched_flows.parquet"
+    write_csv = '--csv' in sys.argv[1:]
+    
+    # Check if file exists (either as Parquet or CSV)
+    found = flow_file(input_file)
+    if found is None:
+        print(f"[!] Error: {input_file} not found!")
+        print("[!] Please run the pipeline first:")
+        print("    1. python pcap_to_flows.py")
+        print("    2. python real_scale.py")
+        print("    3. python flow_enricher.py")
+        return None
+    input_file = found
+    
+    output_file = "data/final_analysis.parquet"
+    csv_file = "data/final_analysis.csv"
+    csv_output_file = csv_file if write_csv else None
+    report_file = "reports/cost_analysis_report.json"
+    cache_key_file = "reports/.cache_key"
+    
+    # Skip the whole analysis if the input and requested outputs haven't changed since the last run
+    cache_key = input_fingerprint(input_file) + (":csv" if write_csv else "")
+    outputs = [report_file, output_file] + ([csv_output_file] if write_csv else [])
+    if os.path.exists(cache_key_file) and all(os.path.exists(path) for path in outputs):
+        with open(cache_key_file) as f:
+            cached_key = f.read().strip()
+        if cached_key == cache_key:
+            print(f"[+] {input_file} unchanged since last run, using cached report: {report_file}")
+            with open(report_file, 'rb') as f:
+                report = orjson.loads(f.read())
+            print_summary(report)
+            return report
+    
+    summary_file = "reports/executive_summary.txt"
+    os.makedirs("reports", exist_ok=True)
+    
+    # Invalidate the previous outputs before rewriting them; a CSV mirror this run
+    # won't refresh would no longer match the Parquet output
+    if os.path.exists(cache_key_file):
+        os.remove(cache_key_file)
+    if not write_csv and os.path.exists(csv_file):
+        os.remove(csv_file)
+    
+    # Initialize cost calculator
+    calculator = CostCalculatorNRS()
+    
+    print(f"[+] Loading data: {input_file}")
+    writer = FlowChunkWriter(output_file, csv_output_file)
+    try:
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            # Stream enriched flows chunk by chunk so memory stays flat for large inputs
+            totals = stream_flow_costs(pool, input_file, calculator, writer)
+            writer.close()
+            print(f"[+] Processed {totals['flows']} flows")
+            print(f"[✓] Saved enriched flows to: {output_file}")
+            if csv_output_file:
+                print(f"[✓] Saved enriched flows to: {csv_output_file}")
+            
+            # Generate cost report
+            report = calculator.build_cost_report(totals)
+            
+            # Save report to JSON and a simple text summary side by side
+            json_write = pool.submit(write_json_report, report, report_file)
+            summary_write = pool.submit(write_executive_summary, report, summary_file)
+            json_write.result()
+            print(f"[✓] Saved detailed report to: {report_file}")
+            summary_write.result()
+            print(f"[✓] Saved executive summary to: {summary_file}")
+    finally:
+        # Always finalize the Parquet file, even if a stage failed
+        writer.close()
+    
+    # Remember which input produced these outputs
+    with open(cache_key_file, 'w') as f:
+        f.write(cache_key)
+    
+    # Print summary
+    print_summary(report)
     
-    return df_with_costs, report
+    return report
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,7 +7,9 @@ Run with: streamlit run src/dashboard.py
 """
 
 import streamlit as st
-import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import duckdb
 import plotly.express as px
 import plotly.graph_objects as go
 import os
@@ -23,38 +25,120 @@ st.set_page_config(
 st.title("📊 FlowSpend: Network Cost Dashboard")
 st.markdown("Interactive visualization of network traffic costs in NRS")
 
-@st.cache_data
-def load_data():
-    """Load data with caching"""
-    data_files = [
-        'data/final_analysis.csv',
-        'data/final_nrs_analysis.csv',
-        'data/ai_enhanced_flows.csv'
-    ]
-    
-    for file in data_files:
+DATA_FILES = [
+    'data/final_analysis.parquet',
+    'data/final_analysis.csv',
+    'data/final_nrs_analysis.csv',
+    'data/ai_enhanced_flows.csv'
+]
+
+def find_data_file():
+    """First available data file, or None"""
+    for file in DATA_FILES:
         if os.path.exists(file):
-            df = pd.read_csv(file)
-            return df
+            return file
+    return None
+
+def file_version(file):
+    """(mtime, size) of a data file, so caches keyed on it refresh when the pipeline rewrites it"""
+    if file is None:
+        return None
+    stat = os.stat(file)
+    return stat.st_mtime_ns, stat.st_size
+
+@st.cache_resource(max_entries=2)
+def load_data(file, version):
+    """Load a CSV data file once per version as an immutable Arrow table shared by every rerun (no per-hit copy)"""
+    if file is None:
+        # If no data, use sample
+        return pa.table({
+            'src_ip': ['192.168.1.1', '192.168.1.2'],
+            'dst_ip': ['20.42.65.90', '8.8.8.8'],
+            'cost_nrs': [1500.0, 800.0],
+            'total_gb': [17.6, 10.5],
+            'traffic_type': ['CLOUD_EGRESS', 'INTERNET_EGRESS']
+        })
     
-    # If no data, show sample
-    st.warning("No data file found. Showing sample data.")
-    return pd.DataFrame({
-        'src_ip': ['192.168.1.1', '192.168.1.2'],
-        'dst_ip': ['20.42.65.90', '8.8.8.8'],
-        'cost_nrs': [1500, 800],
-        'total_gb': [17.6, 10.5],
-        'traffic_type': ['CLOUD_EGRESS', 'INTERNET_EGRESS']
-    })
+    return pa_csv.read_csv(file, convert_options=pa_csv.ConvertOptions(
+        column_types={'total_bytes': pa.int64(), 'hour': pa.int16()}
+    ))
+
+@st.cache_resource(max_entries=2)
+def get_connection(file, version):
+    """In-process DuckDB connection exposing the flow data as a `flows` relation"""
+    con = duckdb.connect()
+    if file is not None and file.endswith('.parquet'):
+        # Query the Parquet file directly so filters and projections are pushed down to the scan
+        con.execute(f"CREATE VIEW flows AS SELECT * FROM read_parquet('{file}')")
+    else:
+        con.register('flows_source', load_data(file, version))
+        con.execute("CREATE TABLE flows AS SELECT * FROM flows_source")
+        con.unregister('flows_source')
+    return con
 
 # Load data
-df = load_data()
+data_file = find_data_file()
+data_version = file_version(data_file)
+if data_file is None:
+    st.warning("No data file found. Showing sample data.")
+
+# Filters are applied inside DuckDB; only result rows come back to Python
+FILTER_SQL = "cost_nrs BETWEEN ? AND ? AND list_contains(?::VARCHAR[], traffic_type)"
+
+def query(file, version, sql, params=None):
+    """Run a query on a per-call cursor of the shared connection and return a DataFrame"""
+    return get_connection(file, version).cursor().execute(sql, params or []).df()
+
+@st.cache_data(max_entries=2)
+def data_overview(file, version):
+    """Cost bounds and traffic types for the sidebar, scanned once per data file version"""
+    overview = query(file, version, """
+        SELECT min(cost_nrs) AS lo, max(cost_nrs) AS hi, list(DISTINCT traffic_type ORDER BY traffic_type) AS types
+        FROM flows
+    """).to_dict('records')[0]
+    return float(overview['lo']), float(overview['hi']), list(overview['types'])
+
+@st.cache_data(max_entries=32)  # Recent filter combinations
+def build_aggregates(file, version, cost_lo, cost_hi, traffic_types):
+    """Every aggregate the tabs need, computed once per filter change or data file version"""
+    params = [cost_lo, cost_hi, list(traffic_types)]
+    
+    # Totals and per-type cost in one scan
+    by_type = query(file, version, f"""
+        SELECT GROUPING(traffic_type) AS is_total, traffic_type, count(*) AS flows,
+               coalesce(sum(cost_nrs), 0) AS cost_nrs, coalesce(sum(total_gb), 0) AS total_gb
+        FROM flows WHERE {FILTER_SQL}
+        GROUP BY GROUPING SETS ((traffic_type), ())
+        ORDER BY traffic_type
+    """, params)
+    totals = by_type[by_type['is_total'] == 1].iloc[:, 2:].to_dict('records')[0]
+    cost_by_type = by_type[by_type['is_total'] == 0][['traffic_type', 'cost_nrs']].reset_index(drop=True)
+    
+    # Largest flows once, sliced by the "top N" slider
+    top_flows = query(file, version, f"""
+        SELECT src_ip, dst_ip, traffic_type, total_gb, cost_nrs
+        FROM flows WHERE {FILTER_SQL}
+        ORDER BY cost_nrs DESC, src_ip, dst_ip, traffic_type, total_gb LIMIT 50
+    """, params)
+    
+    connections = query(file, version, f"""
+        SELECT src_ip, dst_ip, sum(cost_nrs) AS cost_nrs, sum(total_gb) AS total_gb
+        FROM flows WHERE {FILTER_SQL}
+        GROUP BY src_ip, dst_ip ORDER BY cost_nrs DESC, src_ip, dst_ip LIMIT 20
+    """, params)
+    
+    return {
+        'totals': totals,
+        'cost_by_type': cost_by_type,
+        'top_flows': top_flows,
+        'connections': connections,
+    }
 
 # Sidebar filters
 st.sidebar.header("🔍 Filters")
+min_cost, max_cost, all_traffic_types = data_overview(data_file, data_version)
 
 # Cost range filter
-min_cost, max_cost = float(df['cost_nrs'].min()), float(df['cost_nrs'].max())
 cost_range = st.sidebar.slider(
     "Cost Range (NRS)",
     min_cost, max_cost, (min_cost, max_cost),
@@ -64,27 +148,24 @@ cost_range = st.sidebar.slider(
 # Traffic type filter
 traffic_types = st.sidebar.multiselect(
     "Traffic Types",
-    options=df['traffic_type'].unique(),
-    default=df['traffic_type'].unique()
+    options=all_traffic_types,
+    default=all_traffic_types
 )
 
-# Apply filters
-filtered_df = df[
-    (df['cost_nrs'] >= cost_range[0]) & 
-    (df['cost_nrs'] <= cost_range[1]) &
-    (df['traffic_type'].isin(traffic_types))
-]
+filter_params = [cost_range[0], cost_range[1], list(traffic_types)]
+aggregates = build_aggregates(data_file, data_version, cost_range[0], cost_range[1], tuple(traffic_types))
+totals = aggregates['totals']
 
 # Metrics row
 col1, col2, col3, col4 = st.columns(4)
 with col1:
-    st.metric("Total Flows", f"{len(filtered_df):,}")
+    st.metric("Total Flows", f"{totals['flows']:,}")
 with col2:
-    st.metric("Total Cost", f"NRS {filtered_df['cost_nrs'].sum():,.0f}")
+    st.metric("Total Cost", f"NRS {totals['cost_nrs']:,.0f}")
 with col3:
-    st.metric("Total Data", f"{filtered_df['total_gb'].sum():.1f} GB")
+    st.metric("Total Data", f"{totals['total_gb']:.1f} GB")
 with col4:
-    monthly = filtered_df['cost_nrs'].sum() * 24 * 30
+    monthly = totals['cost_nrs'] * 24 * 30
     st.metric("Monthly Projection", f"NRS {monthly:,.0f}")
 
 # Tabs
@@ -93,7 +174,7 @@ tab1, tab2, tab3, tab4 = st.tabs(["📈 Cost Analysis", "🔝 Top Flows", "🌐
 with tab1:
     # Cost by traffic type
     st.subheader("Cost by Traffic Type")
-    cost_by_type = filtered_df.groupby('traffic_type')['cost_nrs'].sum().reset_index()
+    cost_by_type = aggregates['cost_by_type']
     fig1 = px.bar(cost_by_type, x='traffic_type', y='cost_nrs',
                  color='cost_nrs', color_continuous_scale='viridis')
     st.plotly_chart(fig1, use_container_width=True)
@@ -107,7 +188,11 @@ with tab1:
     
     with col2:
         # Size vs Cost scatter
-        fig3 = px.scatter(filtered_df, x='total_gb', y='cost_nrs',
+        points = query(data_file, data_version, f"""
+            SELECT total_gb, cost_nrs, traffic_type, src_ip, dst_ip
+            FROM flows WHERE {FILTER_SQL}
+        """, filter_params)
+        fig3 = px.scatter(points, x='total_gb', y='cost_nrs',
                          color='traffic_type', size='cost_nrs',
                          hover_data=['src_ip', 'dst_ip'],
                          title='Size vs Cost')
@@ -116,7 +201,7 @@ with tab1:
 with tab2:
     # Top N flows
     n_flows = st.slider("Number of top flows to show", 5, 50, 10)
-    top_flows = filtered_df.nlargest(n_flows, 'cost_nrs')
+    top_flows = aggregates['top_flows'].head(n_flows)
     
     # Horizontal bar chart
     fig4 = px.bar(top_flows, 
@@ -147,13 +232,10 @@ with tab3:
     st.subheader("Costly Connections")
     
     # Create node-link data
-    connections = filtered_df.groupby(['src_ip', 'dst_ip']).agg({
-        'cost_nrs': 'sum',
-        'total_gb': 'sum'
-    }).reset_index()
+    connections = aggregates['connections']
     
     # Show as table first
-    st.dataframe(connections.nlargest(20, 'cost_nrs'),
+    st.dataframe(connections,
                 column_config={
                     "cost_nrs": st.column_config.NumberColumn(
                         "Total Cost (NRS)",
@@ -168,7 +250,7 @@ with tab3:
     
     # Sankey diagram for top connections
     if len(connections) > 0:
-        top_conn = connections.nlargest(10, 'cost_nrs')
+        top_conn = connections.head(10)
         
         # Create Sankey diagram
         fig5 = go.Figure(data=[go.Sankey(
@@ -192,6 +274,7 @@ with tab3:
 with tab4:
     # Raw data viewer
     st.subheader("Raw Flow Data")
+    filtered_df = query(data_file, data_version, f"SELECT * FROM flows WHERE {FILTER_SQL}", filter_params)
     st.dataframe(filtered_df, use_container_width=True)
     
     # Export option
@@ -205,4 +288,4 @@ with tab4:
 
 # Footer
 st.markdown("---")
-st.caption(f"FlowSpend Dashboard • {len(filtered_df)} flows • NRS {filtered_df['cost_nrs'].sum():,.0f} total cost")
\ No newline at end of file
+st.caption(f"FlowSpend Dashboard • {totals['flows']} flows • NRS {totals['cost_nrs']:,.0f} total cost")
\ No newline at end of file
@@ -5,81 +5,99 @@ Add business features to network flows for cost analysis
 """
 
 import pandas as pd
+import numpy as np
 import sys
 import os
 
-def enrich_flows(input_file="data/flows_scaled.csv", output_file="data/enriched_flows.csv"):
+from utils import (
+    ips_to_u32, match_ip_prefixes, prefix_range_table, classify_ip_ranges,
+    flow_file, read_flows, write_flows,
+)
+
+# Prefix rules (startswith semantics: '172.' covers all of 172/8)
+INTERNAL_PREFIXES = ['192.168.', '10.', '172.']
+LOCAL_PREFIXES = INTERNAL_PREFIXES + ['127.']
+CLOUD_PREFIXES = ['20.', '13.', '52.', '54.', '35.', '34.']
+SERVICE_PREFIXES = ['8.8.', '140.82.', '173.194.', '185.199.']
+
+# Label sets for the Categorical columns (code order used by enrich_flows)
+DIRECTIONS = ['INTERNAL', 'UPLOAD', 'DOWNLOAD']
+SIZE_CATEGORIES = ['SMALL', 'MEDIUM', 'LARGE', 'VERY_LARGE']
+DESTINATION_TYPES = ['CLOUD', 'INTERNAL', 'SERVICE', 'INTERNET']
+
+# Destination rules as one sorted uint32 range table (codes index DESTINATION_TYPES)
+DESTINATION_RANGES = prefix_range_table([CLOUD_PREFIXES, LOCAL_PREFIXES, SERVICE_PREFIXES])
+
+def enrich_flows(input_file="data/flows_scaled.parquet", output_file="data/enriched_flows.parquet"):
     """
     Add business-relevant features to flows
     """
-    print(f"[+] Loading: {input_file}")
-    
-    if not os.path.exists(input_file):
+    # Accept either the Parquet or the CSV form of the input
+    path = flow_file(input_file)
+    if path is None:
         print(f"[!] Error: {input_file} not found!")
         print(f"[!] Run real_scale.py first")
         return None
     
-    df = pd.read_csv(input_file)
+    print(f"[+] Loading: {path}")
+    df = read_flows(path)
     
     print(f"[+] Enriching {len(df)} flows...")
     
+    # Every derived column is computed from NumPy locals and attached in one assign
+    
     # 1. Calculate GB for cost analysis
-    df['total_gb'] = df['total_bytes'] / (1024**3)
+    total_gb = df['total_bytes'].to_numpy(dtype=np.float64) / (1024**3)
     
     # 2. Add hour column (for peak hour analysis)
     # Default: alternate between peak (9-17) and off-peak
-    df['hour'] = [14 if i % 2 == 0 else 3 for i in range(len(df))]  # 2 PM or 3 AM
-    
-    # 3. Add traffic direction
-    def get_direction(src_ip, dst_ip):
-        if src_ip.startswith(('192.168.', '10.', '172.')):
-            if dst_ip.startswith(('192.168.', '10.', '172.', '127.')):
-                return 'INTERNAL'
-            else:
-                return 'UPLOAD'  # Expensive!
-        else:
-            return 'DOWNLOAD'  # Usually cheaper
-    
-    df['direction'] = df.apply(lambda x: get_direction(x['src_ip'], x['dst_ip']), axis=1)
-    
-    # 4. Add flow size categories
-    def categorize_size(gb):
-        if gb > 10:
-            return 'VERY_LARGE'
-        elif gb > 1:
-            return 'LARGE'
-        elif gb > 0.1:
-            return 'MEDIUM'
-        else:
-            return 'SMALL'
-    
-    df['size_category'] = df['total_gb'].apply(categorize_size)
+    hour = np.tile(np.array([14, 3], dtype=np.int8), (len(df) + 1) // 2)[:len(df)]  # 2 PM or 3 AM
+    
+    # Pack IPs to uint32 once; prefix rules become integer mask compares
+    src_u32 = ips_to_u32(df['src_ip'])
+    dst_u32 = ips_to_u32(df['dst_ip'])
+    dst_local = match_ip_prefixes(dst_u32, LOCAL_PREFIXES)
+    
+    # 3. Add traffic direction (UPLOAD is expensive, DOWNLOAD usually cheaper)
+    src_internal = match_ip_prefixes(src_u32, INTERNAL_PREFIXES)
+    direction = pd.Categorical.from_codes(
+        np.select([src_internal & dst_local, src_internal], [0, 1], default=2),
+        categories=DIRECTIONS
+    )
+    
+    # 4. Add flow size categories (bins are right-closed: exactly 1 GB is MEDIUM)
+    size_category = pd.cut(
+        np.where(np.isnan(total_gb), 0, total_gb),
+        bins=[-np.inf, 0.1, 1, 10, np.inf],
+        labels=SIZE_CATEGORIES
+    )
     
     # 5. Add peak hour flag
-    df['is_peak_hour'] = df['hour'].between(9, 17)
-    
-    # 6. Identify destination type
-    def get_destination_type(ip):
-        # Cloud providers
-        if ip.startswith(('20.', '13.', '52.', '54.', '35.', '34.')):
-            return 'CLOUD'
-        # Internal/Localhost
-        elif ip.startswith(('192.168.', '10.', '172.', '127.')):
-            return 'INTERNAL'
-        # Well-known services
-        elif ip.startswith(('8.8.', '140.82.', '173.194.', '185.199.')):
-            return 'SERVICE'
-        else:
-            return 'INTERNET'
-    
-    df['destination_type'] = df['dst_ip'].apply(get_destination_type)
-    
-    # 7. Add cost urgency flag
-    df['cost_urgency'] = (df['direction'] == 'UPLOAD') & (df['size_category'].isin(['LARGE', 'VERY_LARGE'])) & df['is_peak_hour']
+    is_peak_hour = (hour >= 9) & (hour <= 17)
+    
+    # 6. Identify destination type: cloud providers, internal/localhost,
+    # well-known services, else internet (first matching rule wins)
+    destination_type = pd.Categorical.from_codes(
+        classify_ip_ranges(dst_u32, *DESTINATION_RANGES),
+        categories=DESTINATION_TYPES
+    )
+    
+    # 7. Add cost urgency flag (UPLOAD, LARGE or VERY_LARGE, peak hour)
+    cost_urgency = (direction.codes == 1) & (size_category.codes >= 2) & is_peak_hour
+    
+    df = df.assign(
+        total_gb=total_gb,
+        hour=hour,
+        direction=direction,
+        size_category=size_category,
+        is_peak_hour=is_peak_hour,
+        destination_type=destination_type,
+        cost_urgency=cost_urgency
+    )
     
     # Save enriched data
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    df.to_csv(output_file, index=False)
+    write_flows(df, output_file)
     
     print(f"[✓] Enriched {len(df)} flows")
     print(f"[✓] Added columns: hour, direction, size_category, destination_type, is_peak_hour, cost_urgency")
@@ -101,7 +119,7 @@ def main():
     print("="*60)
     
     # Get input file from command line or use default
-    input_file = sys.argv[1] if len(sys.argv) > 1 else "data/flows_scaled.csv"
+    input_file = sys.argv[1] if len(sys.argv) > 1 else "data/flows_scaled.parquet"
     
     # Enrich flows
     df = enrich_flows(input_file)
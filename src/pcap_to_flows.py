@@ -4,15 +4,182 @@ pcap_to_flows.py
 Extract network flows from PCAP files
 """
 
-from scapy.all import rdpcap, IP, TCP, UDP
+import dpkt
 import pandas as pd
-from collections import defaultdict
+import numpy as np
 import sys
 import os
 
-def extract_flows(pcap_file="data/sample.pcap", output_file="data/flows.csv"):
+from utils import u32_to_ips, write_flows
+
+# Link-layer decoders by pcap linktype (raw IP captures decode straight to IP)
+LINK_DECODERS = {
+    dpkt.pcap.DLT_EN10MB: dpkt.ethernet.Ethernet,
+    dpkt.pcap.DLT_LINUX_SLL: dpkt.sll.SLL,
+    dpkt.pcap.DLT_LINUX_SLL2: dpkt.sll2.SLL2,
+    dpkt.pcap.DLT_NULL: dpkt.loopback.Loopback,
+    dpkt.pcap.DLT_LOOP: dpkt.loopback.Loopback,
+    dpkt.pcap.DLT_RAW: dpkt.ip.IP,
+    dpkt.pcap.DLT_IPV4: dpkt.ip.IP,
+}
+
+# Packets buffered per accumulation pass
+BATCH_PACKETS = 1 << 16
+
+# IP protocol numbers kept as flows, in protocol column category order
+PROTOCOLS = {6: "TCP", 17: "UDP"}
+
+try:
+    from numba import njit, types
+    from numba.typed import Dict
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+if HAS_NUMBA:
+    FLOW_KEY = types.UniTuple(types.int64, 3)
+    
+    @njit(cache=True)
+    def _aggregate_packets(index_of, n_flows, src, dst, ports, times, sizes,
+                           flow_src, flow_dst, flow_ports, start_time, end_time, total_bytes, packet_count):
+        """Fold one batch of packets into the flow columns; returns the new flow count"""
+        for i in range(src.shape[0]):
+            key = (src[i], dst[i], ports[i])
+            if key in index_of:
+                idx = index_of[key]
+            else:
+                idx = n_flows
+                index_of[key] = idx
+                n_flows += 1
+                flow_src[idx] = src[i]
+                flow_dst[idx] = dst[i]
+                flow_ports[idx] = ports[i]
+                start_time[idx] = times[i]
+            
+            end_time[idx] = times[i]
+            total_bytes[idx] += sizes[i]
+            packet_count[idx] += 1
+        
+        return n_flows
+
+class FlowTable:
     """
-    Extract flows from PCAP file and save to CSV
+    Per-flow packet stats in growable NumPy columns, keyed by 5-tuple
+    Keys are (src_u32, dst_u32, sport << 24 | dport << 8 | proto) integers
+    """
+    
+    COLUMNS = ('flow_src', 'flow_dst', 'flow_ports', 'start_time', 'end_time', 'total_bytes', 'packet_count')
+    
+    def __init__(self, capacity=1024):
+        self.n_flows = 0
+        self.index_of = Dict.empty(key_type=FLOW_KEY, value_type=types.int64) if HAS_NUMBA else {}
+        self.flow_src = np.zeros(capacity, dtype=np.int64)
+        self.flow_dst = np.zeros(capacity, dtype=np.int64)
+        self.flow_ports = np.zeros(capacity, dtype=np.int64)
+        self.start_time = np.zeros(capacity, dtype=np.float64)
+        self.end_time = np.zeros(capacity, dtype=np.float64)
+        self.total_bytes = np.zeros(capacity, dtype=np.int64)
+        self.packet_count = np.zeros(capacity, dtype=np.int64)
+        
+        # Pending packets, folded into the columns by flush()
+        self._src, self._dst, self._ports, self._times, self._sizes = [], [], [], [], []
+    
+    def add(self, src, dst, sport, dport, proto, timestamp, size):
+        self._src.append(src)
+        self._dst.append(dst)
+        self._ports.append((sport << 24) | (dport << 8) | proto)
+        self._times.append(timestamp)
+        self._sizes.append(size)
+        if len(self._src) >= BATCH_PACKETS:
+            self.flush()
+    
+    def _reserve(self, n):
+        """Grow the columns geometrically to hold at least n flows"""
+        capacity = len(self.total_bytes)
+        if n <= capacity:
+            return
+        while capacity < n:
+            capacity *= 2
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+    
+    def flush(self):
+        if not self._src:
+            return
+        
+        src = np.array(self._src, dtype=np.int64)
+        dst = np.array(self._dst, dtype=np.int64)
+        ports = np.array(self._ports, dtype=np.int64)
+        times = np.array(self._times, dtype=np.float64)
+        sizes = np.array(self._sizes, dtype=np.int64)
+        keys = zip(self._src, self._dst, self._ports)
+        self._src, self._dst, self._ports, self._times, self._sizes = [], [], [], [], []
+        
+        # Worst case every packet in the batch starts a new flow
+        self._reserve(self.n_flows + len(src))
+        
+        if HAS_NUMBA:
+            self.n_flows = _aggregate_packets(
+                self.index_of, self.n_flows, src, dst, ports, times, sizes,
+                *(getattr(self, name) for name in self.COLUMNS)
+            )
+            return
+        
+        # NumPy fallback: one dict lookup per packet, then whole-batch updates
+        index_of = self.index_of
+        idx = np.fromiter((index_of.setdefault(key, len(index_of)) for key in keys), dtype=np.int64, count=len(src))
+        n_old, n = self.n_flows, len(index_of)
+        
+        # First and last packet of each flow within the batch (capture order)
+        flows, first = np.unique(idx, return_index=True)
+        last = len(idx) - 1 - np.unique(idx[::-1], return_index=True)[1]
+        new = flows >= n_old
+        self.flow_src[flows[new]] = src[first[new]]
+        self.flow_dst[flows[new]] = dst[first[new]]
+        self.flow_ports[flows[new]] = ports[first[new]]
+        self.start_time[flows[new]] = times[first[new]]
+        self.end_time[flows] = times[last]
+        
+        self.total_bytes[:n] += np.bincount(idx, weights=sizes, minlength=n).astype(np.int64)
+        self.packet_count[:n] += np.bincount(idx, minlength=n)
+        self.n_flows = n
+    
+    def to_frame(self):
+        """One row per flow, in order of first appearance"""
+        self.flush()
+        n = self.n_flows
+        ports = self.flow_ports[:n]
+        duration = self.end_time[:n] - self.start_time[:n]
+        total_bytes = self.total_bytes[:n]
+        
+        return pd.DataFrame({
+            "src_ip": u32_to_ips(self.flow_src[:n]),
+            "dst_ip": u32_to_ips(self.flow_dst[:n]),
+            "src_port": (ports >> 24) & 0xFFFF,
+            "dst_port": (ports >> 8) & 0xFFFF,
+            "protocol": pd.Categorical.from_codes(
+                np.searchsorted(list(PROTOCOLS), ports & 0xFF), categories=list(PROTOCOLS.values())
+            ),
+            "duration_sec": np.round(duration, 2),
+            "total_bytes": total_bytes,
+            "packet_count": self.packet_count[:n],
+            "bytes_per_sec": np.round(total_bytes / np.maximum(duration, 0.1), 2)
+        })
+
+def open_capture(f):
+    """dpkt reader for a classic pcap or pcapng file object"""
+    try:
+        return dpkt.pcap.Reader(f)
+    except (ValueError, dpkt.UnpackError):
+        f.seek(0)
+        return dpkt.pcapng.Reader(f)
+
+def extract_flows(pcap_file="data/sample.pcap", output_file="data/flows.parquet"):
+    """
+    Extract flows from PCAP file and save to Parquet (or CSV for a .csv output_file)
     """
     print(f"[+] Reading PCAP: {pcap_file}")
     
@@ -21,79 +188,61 @@ def extract_flows(pcap_file="data/sample.pcap", output_file="data/flows.csv"):
         print(f"[!] Error: {pcap_file} not found!")
         return None
     
-    # Dictionary to store flows
-    flows = defaultdict(lambda: {
-        "start_time": None,
-        "end_time": None,
-        "total_bytes": 0,
-        "packet_count": 0
-    })
+    flows = FlowTable()
     
+    f = open(pcap_file, 'rb')
     try:
-        packets = rdpcap(pcap_file)
-    except Exception as e:
+        reader = open_capture(f)
+    except (ValueError, dpkt.UnpackError) as e:
+        f.close()
         print(f"[!] Error reading PCAP: {e}")
         return None
     
-    print(f"[+] Processing {len(packets)} packets...")
+    decode = LINK_DECODERS.get(reader.datalink())
+    if decode is None:
+        f.close()
+        print(f"[!] Error: unsupported link type {reader.datalink()}")
+        return None
     
-    for pkt in packets:
-        if IP not in pkt:
-            continue
-        
-        # Get protocol
-        if TCP in pkt:
-            proto = "TCP"
-            sport = pkt[TCP].sport
-            dport = pkt[TCP].dport
-        elif UDP in pkt:
-            proto = "UDP"
-            sport = pkt[UDP].sport
-            dport = pkt[UDP].dport
-        else:
-            continue
-        
-        # Get IP and packet info
-        src = pkt[IP].src
-        dst = pkt[IP].dst
-        timestamp = pkt.time
-        size = len(pkt)
-        
-        # Create flow key (5-tuple)
-        flow_key = (src, dst, sport, dport, proto)
-        flow = flows[flow_key]
-        
-        # Update flow stats
-        if flow["start_time"] is None:
-            flow["start_time"] = timestamp
-        
-        flow["end_time"] = timestamp
-        flow["total_bytes"] += size
-        flow["packet_count"] += 1
+    # Stream packets one at a time instead of loading the whole capture
+    print("[+] Processing packets...")
+    n_packets = 0
     
-    # Convert to DataFrame
-    rows = []
-    for key, data in flows.items():
-        src, dst, sport, dport, proto = key
-        duration = data["end_time"] - data["start_time"]
-        
-        rows.append({
-            "src_ip": src,
-            "dst_ip": dst,
-            "src_port": sport,
-            "dst_port": dport,
-            "protocol": proto,
-            "duration_sec": round(duration, 2),
-            "total_bytes": data["total_bytes"],
-            "packet_count": data["packet_count"],
-            "bytes_per_sec": round(data["total_bytes"] / max(duration, 0.1), 2)
-        })
+    with f:
+        for timestamp, buf in reader:
+            n_packets += 1
+            try:
+                ip = decode(buf)
+            except dpkt.UnpackError:
+                continue
+            if not isinstance(ip, dpkt.ip.IP):
+                ip = ip.data
+                if not isinstance(ip, dpkt.ip.IP):
+                    continue
+            
+            # Get protocol
+            l4 = ip.data
+            if isinstance(l4, dpkt.tcp.TCP):
+                proto = 6
+            elif isinstance(l4, dpkt.udp.UDP):
+                proto = 17
+            else:
+                continue
+            
+            # Update flow stats (5-tuple key, IPs as integers)
+            flows.add(
+                int.from_bytes(ip.src, 'big'), int.from_bytes(ip.dst, 'big'),
+                l4.sport, l4.dport, proto, timestamp, len(buf)
+            )
     
-    df = pd.DataFrame(rows)
+    print(f"[+] Processed {n_packets} packets")
+    
+    # Convert to DataFrame
+    df = flows.to_frame()
     
-    # Save to CSV
+    # Save
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    df.to_csv(output_file, index=False)
+    write_flows(df, output_file)
     
     print(f"[✓] Extracted {len(df)} flows")
     print(f"[✓] Saved to: {output_file}")
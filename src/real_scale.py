@@ -4,25 +4,27 @@ real_scale.py
 Scale flow data to business levels for realistic cost analysis
 """
 
-import pandas as pd
 import numpy as np
 import sys
 import os
 
-def scale_flows(input_file="data/flows.csv", output_file="data/flows_scaled.csv", scale_factor=1000000):
+from utils import flow_file, read_flows, write_flows
+
+def scale_flows(input_file="data/flows.parquet", output_file="data/flows_scaled.parquet", scale_factor=1000000):
     """
     Scale flow data to business levels
     Args:
         scale_factor: Multiply all bytes by this factor (default: 1,000,000)
     """
-    print(f"[+] Loading: {input_file}")
-    
-    if not os.path.exists(input_file):
+    # Accept either the Parquet or the CSV form of the input
+    path = flow_file(input_file)
+    if path is None:
         print(f"[!] Error: {input_file} not found!")
         print(f"[!] Run pcap_to_flows.py first")
         return None
     
-    df = pd.read_csv(input_file)
+    print(f"[+] Loading: {path}")
+    df = read_flows(path)
     
     # Show before scaling
     original_bytes = df['total_bytes'].sum()
@@ -33,17 +35,21 @@ def scale_flows(input_file="data/flows.csv", output_file="data/flows_scaled.csv"
     print(f"    Total GB: {original_gb:.6f}")
     print(f"    Average flow: {df['total_bytes'].mean():.0f} bytes")
     
-    # Apply scaling
+    # Apply scaling (on NumPy arrays, written back to the frame once)
     print(f"[+] Scaling by {scale_factor:,}x...")
-    df['total_bytes'] = df['total_bytes'] * scale_factor
+    total_bytes = df['total_bytes'].to_numpy(dtype=np.int64) * scale_factor
+    duration = df['duration_sec'].to_numpy(dtype=np.float64)
     
     # Recalculate derived fields
-    df['bytes_per_sec'] = df['total_bytes'] / df['duration_sec'].clip(lower=0.1)
+    bytes_per_sec = total_bytes / np.maximum(duration, 0.1)
     
     # Make some flows extra large for realistic analysis
     np.random.seed(42)
-    large_indices = np.random.choice(df.index, size=min(10, len(df)), replace=False)
-    df.loc[large_indices, 'total_bytes'] = df.loc[large_indices, 'total_bytes'] * 10
+    large_indices = np.random.choice(len(df), size=min(10, len(df)), replace=False)
+    total_bytes[large_indices] *= 10
+    
+    df['total_bytes'] = total_bytes
+    df['bytes_per_sec'] = bytes_per_sec
     
     # Show after scaling
     scaled_bytes = df['total_bytes'].sum()
@@ -56,7 +62,7 @@ def scale_flows(input_file="data/flows.csv", output_file="data/flows_scaled.csv"
     
     # Save
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    df.to_csv(output_file, index=False)
+    write_flows(df, output_file)
     
     print(f"[✓] Saved scaled data to: {output_file}")
     print(f"[✓] Scaling factor applied: {scale_factor:,}x")
@@ -71,7 +77,7 @@ def main():
     print("="*60)
     
     # Get input file from command line or use default
-    input_file = sys.argv[1] if len(sys.argv) > 1 else "data/flows.csv"
+    input_file = sys.argv[1] if len(sys.argv) > 1 else "data/flows.parquet"
     
     # Scale flows
     df = scale_flows(input_file)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+utils.py
+Shared helpers for IPv4 handling and flow files across the FlowSpend pipeline
+"""
+
+import os
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+# Column dtypes for flow CSVs, so read_csv skips inference (extra columns are inferred)
+FLOW_DTYPES = {
+    'src_ip': 'category',
+    'dst_ip': 'category',
+    'protocol': 'category',
+    'src_port': np.uint16,
+    'dst_port': np.uint16,
+    'total_bytes': np.int64,
+    'packet_count': np.int32,
+    'duration_sec': np.float64,
+}
+
+# Dotted-quad shape check, evaluated by Arrow's RE2 engine (linear time, no backtracking)
+IPV4_PATTERN = r'^(?:\d{1,3}\.){3}\d{1,3}$'
+
+# First-octet table entries (see prefix_octet_table)
+OCTET_MISS, OCTET_MATCH, OCTET_CHECK = 0, 1, 2
+
+def ips_to_u32(ips):
+    """
+    Convert a column of dotted-quad IPv4 strings to a uint32 array
+    Malformed or non-IPv4 addresses map to 0 (0.0.0.0)
+    """
+    # Parse each distinct address once; flow columns repeat a few hosts heavily
+    ips = pd.Series(ips)
+    if isinstance(ips.dtype, pd.CategoricalDtype):
+        codes, uniques = ips.cat.codes.to_numpy(), ips.cat.categories
+    else:
+        codes, uniques = pd.factorize(ips)
+    
+    # Missing values (code -1) pick up the trailing 0
+    return np.append(_parse_ips(uniques), np.uint32(0))[codes]
+
+def _parse_ips(ips):
+    """ips_to_u32 for an array of distinct addresses"""
+    ips = pc.cast(pa.array(pd.Series(ips)), pa.string())
+    u32 = np.zeros(len(ips), dtype=np.uint32)
+
+    valid = pc.fill_null(pc.match_substring_regex(ips, IPV4_PATTERN), False)
+    valid = valid.to_numpy(zero_copy_only=False)
+    if not valid.any():
+        return u32
+
+    # Split and parse every valid address in Arrow's C++ kernels
+    octets = pc.list_flatten(pc.split_pattern(pc.filter(ips, valid), '.'))
+    octets = pc.cast(octets, pa.uint32()).to_numpy().reshape(-1, 4)
+    in_range = (octets <= 255).all(axis=1)
+    packed = (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+    u32[valid] = np.where(in_range, packed, 0)
+
+    return u32
+
+def u32_to_ips(u32):
+    """Inverse of ips_to_u32: dotted-quad strings for a uint32 array"""
+    u32 = np.asarray(u32, dtype=np.uint32)
+    octets = [pc.cast(pa.array((u32 >> shift) & 0xFF), pa.string()) for shift in (24, 16, 8, 0)]
+    return pc.binary_join_element_wise(*octets, '.').to_numpy(zero_copy_only=False)
+
+def prefixes_to_masks(prefixes):
+    """
+    Encode dotted prefixes like '10.' or '192.168.' as (value, mask) arrays
+    """
+    values, masks = [], []
+    for prefix in prefixes:
+        octets = [int(o) for o in prefix.rstrip('.').split('.')]
+        shift = 32 - 8 * len(octets)
+        value = 0
+        for octet in octets:
+            value = (value << 8) | octet
+        values.append(value << shift)
+        masks.append((0xFFFFFFFF << shift) & 0xFFFFFFFF)
+
+    return np.array(values, dtype=np.uint32), np.array(masks, dtype=np.uint32)
+
+def prefix_octet_table(prefixes):
+    """
+    256-entry uint8 table indexed by first octet: OCTET_MATCH where a one-octet
+    prefix covers it, OCTET_CHECK where only a two-octet prefix could match
+    """
+    table = np.full(256, OCTET_MISS, dtype=np.uint8)
+    for prefix in prefixes:
+        octets = prefix.rstrip('.').split('.')
+        first = int(octets[0])
+        if len(octets) == 1:
+            table[first] = OCTET_MATCH
+        elif table[first] != OCTET_MATCH:
+            table[first] = OCTET_CHECK
+    
+    return table
+
+def match_prefixes_by_octet(ips_u32, table, values, masks):
+    """match_prefixes, deciding most rows by first-octet lookup alone"""
+    octet_class = table[ips_u32 >> 24]
+    matched = octet_class == OCTET_MATCH
+    
+    # Only rows whose first octet is ambiguous need the full mask test
+    check = np.flatnonzero(octet_class == OCTET_CHECK)
+    if len(check):
+        matched[check] = match_prefixes(ips_u32[check], values, masks)
+    
+    return matched
+
+def match_prefixes(ips_u32, values, masks):
+    """Boolean mask of IPs falling inside any of the encoded prefixes"""
+    return ((ips_u32[:, None] & masks[None, :]) == values[None, :]).any(axis=1)
+
+def match_ip_prefixes(ips_u32, prefixes):
+    """Boolean mask of uint32 IPs starting with any of the dotted prefixes"""
+    values, masks = prefixes_to_masks(prefixes)
+    return match_prefixes_by_octet(ips_u32, prefix_octet_table(prefixes), values, masks)
+
+def prefix_range_table(prefix_groups):
+    """
+    Sorted range table for first-match classification of uint32 IPs
+    IPs under any prefix of prefix_groups[i] get code i (earlier groups win),
+    all others get len(prefix_groups); returns (bounds, codes)
+    """
+    ranges = []
+    for code, prefixes in enumerate(prefix_groups):
+        values, masks = prefixes_to_masks(prefixes)
+        for value, mask in zip(values.tolist(), masks.tolist()):
+            ranges.append((value, value + (~mask & 0xFFFFFFFF) + 1, code))
+    
+    # Each bound starts a segment [bound, next bound) with a single code
+    bounds = sorted({0} | {lo for lo, _, _ in ranges} | {hi for _, hi, _ in ranges if hi < 1 << 32})
+    codes = [min((c for lo, hi, c in ranges if lo <= start < hi), default=len(prefix_groups)) for start in bounds]
+    
+    return np.array(bounds, dtype=np.int64), np.array(codes, dtype=np.int8)
+
+def classify_ip_ranges(ips_u32, bounds, codes):
+    """Code per uint32 IP from a prefix_range_table, via one binary search each"""
+    return codes[np.searchsorted(bounds, ips_u32, side='right') - 1]
+
+def flow_file(path):
+    """path if it exists, else its .parquet/.csv counterpart (None if neither)"""
+    if os.path.exists(path):
+        return path
+    base, ext = os.path.splitext(path)
+    other = base + ('.csv' if ext == '.parquet' else '.parquet')
+    return other if os.path.exists(other) else None
+
+def read_flows(path, **csv_options):
+    """Load a flows table from Parquet, or from CSV with FLOW_DTYPES (csv_options go to pd.read_csv)"""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    options = {'dtype': FLOW_DTYPES}
+    options.update(csv_options)
+    return pd.read_csv(path, **options)
+
+def write_flows(df, path):
+    """Save a flows table as zstd Parquet, or as CSV if path ends in .csv"""
+    if path.endswith('.csv'):
+        # Arrow's C++ writer formats numbers far faster than DataFrame.to_csv
+        pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), path)
+    else:
+        df.to_parquet(path, compression='zstd', index=False)
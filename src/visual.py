@@ -5,43 +5,44 @@ Create visualizations for FlowSpend network cost analysis
 Saves plots as images in reports/ directory
 """
 
-import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-# Set style
-plt.style.use('seaborn-v0_8-darkgrid')
-sns.set_palette("husl")
+from utils import read_flows
 
 def ensure_reports_dir():
     """Ensure reports directory exists"""
     os.makedirs('reports', exist_ok=True)
     os.makedirs('reports/plots', exist_ok=True)
 
-def create_basic_plots(df):
-    """Create basic static plots and save as images"""
-    print("[+] Creating basic plots...")
+def _set_style():
+    """Matplotlib backend and style for the static plots (runs in each plot worker)"""
+    import seaborn as sns
     
-    # 1. Histogram of flow costs
+    matplotlib.use('Agg')  # Figures are only saved to disk
+    plt.style.use('seaborn-v0_8-darkgrid')
+    sns.set_palette("husl")
+
+def _plot_cost_distribution(costs):
+    """Histogram of flow costs"""
     plt.figure(figsize=(10, 6))
-    plt.hist(df['cost_nrs'], bins=50, edgecolor='black', alpha=0.7)
+    plt.hist(costs, bins=50, edgecolor='black', alpha=0.7)
     plt.xlabel('Cost (NRS)')
     plt.ylabel('Number of Flows')
     plt.title('Distribution of Flow Costs')
     plt.grid(True, alpha=0.3)
     plt.savefig('reports/plots/cost_distribution.png', dpi=300, bbox_inches='tight')
     plt.close()
-    print("  ✓ Saved: cost_distribution.png")
-    
-    # 2. Top 10 most expensive flows
-    top_10 = df.nlargest(10, 'cost_nrs')
+    return 'cost_distribution.png'
+
+def _plot_top_flows(top_10):
+    """Top 10 most expensive flows"""
     plt.figure(figsize=(12, 6))
     bars = plt.barh(
-        [f"{row['src_ip']}\n→ {row['dst_ip']}" for _, row in top_10.iterrows()],
+        [f"{src}\n→ {dst}" for src, dst in zip(top_10['src_ip'], top_10['dst_ip'])],
         top_10['cost_nrs'],
         color='coral'
     )
@@ -58,10 +59,10 @@ def create_basic_plots(df):
     plt.tight_layout()
     plt.savefig('reports/plots/top_10_flows.png', dpi=300, bbox_inches='tight')
     plt.close()
-    print("  ✓ Saved: top_10_flows.png")
-    
-    # 3. Cost breakdown by traffic type
-    cost_by_type = df.groupby('traffic_type')['cost_nrs'].sum().sort_values(ascending=False)
+    return 'top_10_flows.png'
+
+def _plot_cost_by_type(cost_by_type):
+    """Cost breakdown by traffic type"""
     plt.figure(figsize=(10, 6))
     cost_by_type.plot(kind='bar', color='skyblue', edgecolor='black')
     plt.xlabel('Traffic Type')
@@ -77,9 +78,10 @@ def create_basic_plots(df):
     plt.tight_layout()
     plt.savefig('reports/plots/cost_by_traffic_type.png', dpi=300, bbox_inches='tight')
     plt.close()
-    print("  ✓ Saved: cost_by_traffic_type.png")
-    
-    # 4. Pie chart of traffic distribution
+    return 'cost_by_traffic_type.png'
+
+def _plot_cost_pie(cost_by_type):
+    """Pie chart of traffic distribution"""
     plt.figure(figsize=(8, 8))
     cost_by_type.plot(kind='pie', autopct='%1.1f%%', startangle=90,
                      colors=plt.cm.Paired.colors, textprops={'fontsize': 10})
@@ -87,12 +89,13 @@ def create_basic_plots(df):
     plt.ylabel('')
     plt.savefig('reports/plots/cost_pie_chart.png', dpi=300, bbox_inches='tight')
     plt.close()
-    print("  ✓ Saved: cost_pie_chart.png")
-    
-    # 5. Scatter plot: Size vs Cost
+    return 'cost_pie_chart.png'
+
+def _plot_size_vs_cost(total_gb, costs):
+    """Scatter plot: Size vs Cost"""
     plt.figure(figsize=(10, 6))
-    scatter = plt.scatter(df['total_gb'], df['cost_nrs'], 
-                         c=df['cost_nrs'], cmap='viridis', 
+    scatter = plt.scatter(total_gb, costs, 
+                         c=costs, cmap='viridis', 
                          alpha=0.6, s=50, edgecolors='black', linewidth=0.5)
     plt.colorbar(scatter, label='Cost (NRS)')
     plt.xlabel('Flow Size (GB)')
@@ -101,39 +104,63 @@ def create_basic_plots(df):
     plt.grid(True, alpha=0.3)
     
     # Log scale if data is skewed
-    if df['total_gb'].max() / df['total_gb'].min() > 100:
+    if total_gb.max() / total_gb.min() > 100:
         plt.xscale('log')
         plt.xlabel('Flow Size (GB) - Log Scale')
     
     plt.tight_layout()
     plt.savefig('reports/plots/size_vs_cost.png', dpi=300, bbox_inches='tight')
     plt.close()
-    print("  ✓ Saved: size_vs_cost.png")
+    return 'size_vs_cost.png'
+
+def _plot_peak_vs_offpeak(peak_cost, off_peak_cost):
+    """Peak vs Off-Peak cost comparison"""
+    plt.figure(figsize=(8, 6))
+    plt.bar(['Peak Hours', 'Off-Peak Hours'], [peak_cost, off_peak_cost], 
+           color=['red', 'green'], edgecolor='black')
+    plt.ylabel('Total Cost (NRS)')
+    plt.title('Cost Comparison: Peak vs Off-Peak Hours')
+    
+    # Add value labels
+    for i, v in enumerate([peak_cost, off_peak_cost]):
+        plt.text(i, v + max(peak_cost, off_peak_cost)*0.01, 
+                f'NRS {v:,.0f}', ha='center', va='bottom')
     
-    # 6. Peak vs Off-Peak cost comparison
+    plt.tight_layout()
+    plt.savefig('reports/plots/peak_vs_offpeak.png', dpi=300, bbox_inches='tight')
+    plt.close()
+    return 'peak_vs_offpeak.png'
+
+def create_basic_plots(df):
+    """Create basic static plots and save as images"""
+    print("[+] Creating basic plots...")
+    
+    # Aggregate once in the parent; workers only receive the data they plot
+    cost_by_type = df.groupby('traffic_type')['cost_nrs'].sum().sort_values(ascending=False)
+    plots = [
+        (_plot_cost_distribution, df['cost_nrs']),
+        (_plot_top_flows, df.nlargest(10, 'cost_nrs')[['src_ip', 'dst_ip', 'cost_nrs']]),
+        (_plot_cost_by_type, cost_by_type),
+        (_plot_cost_pie, cost_by_type),
+        (_plot_size_vs_cost, df['total_gb'], df['cost_nrs']),
+    ]
     if 'is_peak' in df.columns:
         peak_cost = df[df['is_peak']]['cost_nrs'].sum()
         off_peak_cost = df[~df['is_peak']]['cost_nrs'].sum()
-        
-        plt.figure(figsize=(8, 6))
-        plt.bar(['Peak Hours', 'Off-Peak Hours'], [peak_cost, off_peak_cost], 
-               color=['red', 'green'], edgecolor='black')
-        plt.ylabel('Total Cost (NRS)')
-        plt.title('Cost Comparison: Peak vs Off-Peak Hours')
-        
-        # Add value labels
-        for i, v in enumerate([peak_cost, off_peak_cost]):
-            plt.text(i, v + max(peak_cost, off_peak_cost)*0.01, 
-                    f'NRS {v:,.0f}', ha='center', va='bottom')
-        
-        plt.tight_layout()
-        plt.savefig('reports/plots/peak_vs_offpeak.png', dpi=300, bbox_inches='tight')
-        plt.close()
-        print("  ✓ Saved: peak_vs_offpeak.png")
+        plots.append((_plot_peak_vs_offpeak, peak_cost, off_peak_cost))
+    
+    # Each figure renders and PNG-encodes independently, one process per plot
+    workers = min(len(plots), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_set_style) as pool:
+        futures = [pool.submit(plot, *args) for plot, *args in plots]
+        for future in futures:
+            print(f"  ✓ Saved: {future.result()}")
 
 def create_interactive_plots(df):
     """Create interactive HTML plots using Plotly"""
     try:
+        import plotly.express as px
+        
         print("[+] Creating interactive plots...")
         
         # 1. Interactive bar chart of top flows
@@ -180,17 +207,17 @@ def create_summary_report(df):
     total_data = df['total_gb'].sum()
     avg_cost_per_gb = total_cost / total_data if total_data > 0 else 0
     
+    # Categorical keys take pandas' code-based groupby path instead of hashing strings
+    totals = df[['cost_nrs', 'total_gb']]
+    keys = {col: df[col].astype('category') for col in ('src_ip', 'dst_ip', 'traffic_type')}
+    
     # Get top sources
-    top_sources = df.groupby('src_ip').agg({
-        'cost_nrs': 'sum',
-        'total_gb': 'sum'
-    }).nlargest(5, 'cost_nrs')
+    top_sources = totals.groupby(keys['src_ip'], observed=True).sum().nlargest(5, 'cost_nrs')
     
     # Get top destinations
-    top_dests = df.groupby('dst_ip').agg({
-        'cost_nrs': 'sum',
-        'total_gb': 'sum'
-    }).nlargest(5, 'cost_nrs')
+    top_dests = totals.groupby(keys['dst_ip'], observed=True).sum().nlargest(5, 'cost_nrs')
+    
+    cost_by_type = totals['cost_nrs'].groupby(keys['traffic_type'], observed=True).sum()
     
     with open('reports/visualization_summary.txt', 'w') as f:
         f.write("="*60 + "\n")
@@ -216,8 +243,7 @@ def create_summary_report(df):
         
         f.write("\nTRAFFIC TYPE BREAKDOWN:\n")
         f.write("-" * 40 + "\n")
-        for traffic_type, group in df.groupby('traffic_type'):
-            cost = group['cost_nrs'].sum()
+        for traffic_type, cost in cost_by_type.items():
             percentage = (cost / total_cost * 100) if total_cost > 0 else 0
             f.write(f"{traffic_type:20} : NRS {cost:,.2f} ({percentage:.1f}%)\n")
         
@@ -251,6 +277,7 @@ def main():
     
     # Try to load data from different possible locations
     data_files = [
+        'data/final_analysis.parquet',
         'data/final_analysis.csv',
         'data/final_nrs_analysis.csv',
         'data/ai_enhanced_flows.csv'
@@ -260,14 +287,14 @@ def main():
     for file in data_files:
         if os.path.exists(file):
             print(f"[+] Loading data from: {file}")
-            df = pd.read_csv(file)
+            df = read_flows(file)
             print(f"    Loaded {len(df)} flows")
             break
     
     if df is None:
         print("[!] Error: No data file found!")
         print("[!] Please run the cost analysis pipeline first.")
-        print("[!] Expected files: data/final_analysis.csv or data/final_nrs_analysis.csv")
+        print("[!] Expected files: data/final_analysis.parquet or data/final_analysis.csv")
         return
     
     # Create visualizations